@@ -1,17 +1,45 @@
-import json
+import functools
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, List
 
-from generate_pde_jsons import convert_pde_to_json_file
+import orjson
+
+from generate_pde_jsons import RateLimiter, convert_pdes_to_json_files, create_client
 
 
 EXAMPLE_PDES_PATH = "random_pde_list.json"
 
+# Number of chat completions kept in flight at once, and the request- and
+# token-per-minute caps shared by all workers (set PDE_RPM / PDE_TPM to match your
+# OpenAI account tier; 0 disables the corresponding cap).
+PDE_CONCURRENCY = int(os.getenv("PDE_CONCURRENCY", "16"))
+PDE_RPM = float(os.getenv("PDE_RPM", "500"))
+PDE_TPM = float(os.getenv("PDE_TPM", "200000"))
+# Number of PDEs packed into a single chat completion (1 disables batching).
+PDE_BATCH_SIZE = max(1, int(os.getenv("PDE_BATCH_SIZE", "8")))
+
+
+@functools.lru_cache(maxsize=None)
+def _default_domain_piece(var: str) -> str:
+    return f"{var} ∈ [0, 1]"
+
+
+def _entry_digest(entry: Dict[str, Any]) -> bytes:
+    """
+    Stable digest of a (JSON-compatible) PDE entry, independent of key order;
+    unique_examples uses it to spot entries that are repeated verbatim.
+    """
+    return hashlib.blake2b(
+        orjson.dumps(entry, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).digest()
+
 
 def build_description(entry: Dict[str, Any]) -> str:
     """
     Turn one entry from example_pdes.json into a textual description
-    suitable for convert_pde_to_json_file.
+    suitable for convert_pde_to_json_file / convert_pdes_to_json_files.
     """
     name = entry.get("name", "unnamed_pde")
     variables = entry.get("variables", {})
@@ -37,18 +65,17 @@ def build_description(entry: Dict[str, Any]) -> str:
     parameters_obj = entry.get("parameters")  # new structured parameters dict in example_pdes.json
     parameters_values = entry.get("parameters_values")  # legacy free-text like "D=0.01,r=1.0"
 
-    parts: List[str] = []
     # Only give a high-level PDE name; let the model infer variables/parameters
     # from the equation, ICs, BCs, and any parameter-value hints.
-    parts.append(f"PDE name: {name}.")
+    parts: List[str] = [f"PDE name: {name}."]
 
     # Domain: either use explicitly provided domain or assume a reasonable default.
     if isinstance(domain, dict):
-        domain_strs: List[str] = []
-        for var, interval in domain.items():
-            if isinstance(interval, list) and len(interval) == 2:
-                a, b = interval
-                domain_strs.append(f"{var} ∈ [{a}, {b}]")
+        domain_strs = [
+            f"{var} ∈ [{interval[0]}, {interval[1]}]"
+            for var, interval in domain.items()
+            if isinstance(interval, list) and len(interval) == 2
+        ]
         if domain_strs:
             parts.append("Domain: " + "; ".join(domain_strs) + ".")
     elif isinstance(domain, str):
@@ -57,20 +84,13 @@ def build_description(entry: Dict[str, Any]) -> str:
             "Domain description from data (convert this into a structured 'domain' JSON object): "
             + domain
         )
-    else:
-        # Heuristic default domain if none is given.
-        default_pieces: List[str] = []
-        for var in indep:
-            if var.lower() in {"t", "time"}:
-                default_pieces.append(f"{var} ∈ [0, 1]")
-            else:
-                default_pieces.append(f"{var} ∈ [0, 1]")
-        if default_pieces:
-            parts.append(
-                "Assume the following default domain for the independent variables (encode this in the JSON 'domain' field): "
-                + "; ".join(default_pieces)
-                + "."
-            )
+    elif indep:
+        # Heuristic default domain if none is given: [0, 1] for every variable, time included.
+        parts.append(
+            "Assume the following default domain for the independent variables (encode this in the JSON 'domain' field): "
+            + "; ".join([_default_domain_piece(var) for var in indep])
+            + "."
+        )
 
     parts.append(
         "The PDE system, written in a compact symbolic notation using subscripts for derivatives, is:\n"
@@ -111,19 +131,78 @@ def build_description(entry: Dict[str, Any]) -> str:
     return "\n".join(parts)
 
 
-def main() -> None:
-    if not os.path.isfile(EXAMPLE_PDES_PATH):
-        raise FileNotFoundError(f"Could not find {EXAMPLE_PDES_PATH}")
+def load_examples(path: str = EXAMPLE_PDES_PATH) -> List[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Could not find {path}")
+
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
-    with open(EXAMPLE_PDES_PATH, "r", encoding="utf-8") as f:
-        examples: List[Dict[str, Any]] = json.load(f)
 
+def unique_examples(examples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop entries repeated verbatim (same name and content) so each PDE is converted
+    once, and raise ValueError if different PDEs share a name: they would be written
+    to the same output file. The name is part of the digest because it ends up in
+    the prompt and in the generated metadata.
+    """
+    digest_by_name: Dict[str, bytes] = {}
+    conflicts: List[str] = []
+    unique = []
     for entry in examples:
         name = entry.get("name", "unnamed_pde")
-        desc = build_description(entry)
-        print(f"Generating JSON for {name!r}...")
-        output_path = convert_pde_to_json_file(name, desc)
-        print(f"  Saved to {output_path}")
+        digest = _entry_digest(entry)
+        previous = digest_by_name.get(name)
+        if previous is None:
+            digest_by_name[name] = digest
+            unique.append(entry)
+        elif previous == digest:
+            print(f"Skipping repeated entry {name!r} (digest {digest.hex()})")
+        elif name not in conflicts:
+            conflicts.append(name)
+
+    if conflicts:
+        raise ValueError(
+            "Several different PDEs share the same name (they would overwrite the same "
+            f"output file): {', '.join(repr(name) for name in conflicts)}"
+        )
+
+    return unique
+
+
+def main() -> None:
+    examples = load_examples()
+
+    tasks = [
+        (entry.get("name", "unnamed_pde"), build_description(entry))
+        for entry in unique_examples(examples)
+    ]
+
+    client = create_client(max_connections=PDE_CONCURRENCY)
+    rate_limiter = RateLimiter(PDE_RPM, PDE_TPM)
+    failures: List[str] = []
+
+    with ThreadPoolExecutor(max_workers=PDE_CONCURRENCY) as executor:
+        futures = []
+        for start in range(0, len(tasks), PDE_BATCH_SIZE):
+            batch = tasks[start : start + PDE_BATCH_SIZE]
+            print(f"Generating JSON for {', '.join(repr(name) for name, _ in batch)}...")
+            futures.append(
+                executor.submit(
+                    convert_pdes_to_json_files, client, batch, PDE_BATCH_SIZE, rate_limiter
+                )
+            )
+
+        for future in as_completed(futures):
+            for name, output_path, error in future.result():
+                if error is not None:
+                    failures.append(name)
+                    print(f"  Failed {name!r}: {error}")
+                else:
+                    print(f"  Saved {name!r} to {output_path}")
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} PDE(s) failed: {', '.join(failures)}")
 
 
 if __name__ == "__main__":
@@ -1,22 +1,44 @@
+import hashlib
 import os
-import json
-from typing import Dict
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import httpx
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, RateLimitError
 
 
 load_dotenv()
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY is not set in the environment or .env file.")
-
-client = OpenAI(api_key=api_key)
+MODEL = "gpt-5-nano"
 
 OUTPUT_DIR = "random_pde_jsons"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Decoded model replies, keyed by a hash of (system prompt, user prompt, model), so
+# re-runs after a partial failure do not pay for the same completion twice.
+CACHE_DIR = ".pde_cache"
+# Set PDE_SKIP_EXISTING=1 to leave PDEs that already have an output file untouched.
+SKIP_EXISTING = os.getenv("PDE_SKIP_EXISTING") == "1"
+
+# Retries for transient API failures, with exponential backoff plus jitter.
+MAX_RETRIES = int(os.getenv("PDE_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# HTTP timeouts in seconds: fail fast on connecting, but give long (reasoning-model,
+# multi-PDE batch) completions as long as the SDK's default 600s to arrive.
+CONNECT_TIMEOUT = float(os.getenv("PDE_CONNECT_TIMEOUT", "10"))
+REQUEST_TIMEOUT = float(os.getenv("PDE_REQUEST_TIMEOUT", "600"))
+
+# Completion tokens budgeted per PDE when estimating a request's size for the
+# tokens-per-minute limit (a generated PDE JSON is ~1k tokens, plus reasoning).
+OUTPUT_TOKENS_PER_PDE = 2000
+
 
 # This is the example PDE JSON structure you provided, with PDEs + ICs/BCs.
 EXAMPLE_SCHEMA: Dict = {
@@ -242,78 +264,322 @@ EXAMPLE_SCHEMA: Dict = {
 }
 
 
-def convert_pde_to_json_file(pde_name: str, pde_description: str) -> str:
+# Serialized once with sorted keys so the prompt bytes are identical on every call.
+EXAMPLE_SCHEMA_JSON: str = orjson.dumps(
+    EXAMPLE_SCHEMA, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+).decode()
+
+# Everything static lives in the system message, ahead of any per-PDE text, so that
+# OpenAI's automatic prompt caching can reuse this (>1024-token) prefix across calls.
+# Keep anything dynamic (names, descriptions, batch sizes) out of it.
+SYSTEM_PROMPT = (
+    "You are an expert in partial differential equations and symbolic expression trees. "
+    "Convert PDE descriptions into a structured JSON object following the example "
+    "Navier–Stokes JSON schema with PDEs, initial conditions, and boundary conditions. "
+    "Use the same operator-tree style for 'lhs', 'rhs', and 'value_expr' expressions. "
+    "Respond with VALID JSON ONLY, no Markdown, no explanations.\n\n"
+    "SCHEMA:\n"
+    f"{EXAMPLE_SCHEMA_JSON}\n\n"
+    "INSTRUCTIONS:\n"
+    "Use the SAME structure as the example schema above:\n"
+    "- Top-level keys: at least 'metadata', 'variables', 'parameters', 'pdes'. You may also include 'domain', 'initial_conditions', and 'boundary_conditions'.\n"
+    "- Each PDE in 'pdes' has 'equation_id', 'type', 'lhs', 'rhs'.\n"
+    "- 'lhs' and 'rhs' are expression trees built using 'op', 'deriv', 'dep', 'param', 'const', and optionally 'fn'/'var'.\n"
+    "- Initial and boundary conditions, when present, use 'value_expr' nodes that follow the same expression-tree conventions.\n\n"
+    "IMPORTANT:\n"
+    " - Follow the schema closely but adapt field values to each PDE.\n"
+    " - If some information is missing, use null or a short best-guess description.\n"
+    " - Do NOT include any text outside the JSON."
+)
+
+# Loop-invariant pieces of every request, built once instead of per PDE: the system
+# message itself and the (schema-sized) system section of the debug prompt dump.
+SYSTEM_MESSAGE: Dict[str, str] = {"role": "system", "content": SYSTEM_PROMPT}
+_SYSTEM_PROMPT_LOG: str = "\n".join(["-" * 80, "System message:", SYSTEM_PROMPT, "-" * 80])
+
+
+def create_client(max_connections: int = 64, max_retries: int = 0) -> OpenAI:
+    """
+    Create the OpenAI client shared by all conversions (it is safe to use from
+    several threads at once). The underlying HTTP/2 connection pool keeps
+    connections alive between requests, so concurrent workers do not pay a new
+    TCP/TLS handshake per call.
+
+    `max_retries` is the SDK's own retry count. It defaults to 0 because chat
+    completions are retried by _create_completion, which also respects the rate limiter.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set in the environment or .env file.")
+    http_client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=max_retries)
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out calls so that at most `requests_per_minute`
+    requests and `tokens_per_minute` (estimated) tokens are started per minute.
+    Passing 0 for either limit disables it.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = 0) -> None:
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.token_interval = 60.0 / tokens_per_minute if tokens_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self._next_token_slot = self._next_slot
+
+    def wait(self, tokens: int = 0) -> None:
+        if self.interval <= 0 and self.token_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, self._next_token_slot, now)
+            self._next_slot = slot + self.interval
+            self._next_token_slot = slot + tokens * self.token_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def estimate_tokens(user_prompt: str, pde_count: int = 1) -> int:
+    """
+    Rough token count of one request, for RateLimiter: ~4 characters per prompt token
+    plus OUTPUT_TOKENS_PER_PDE for each PDE in the reply.
+    """
+    return (len(SYSTEM_PROMPT) + len(user_prompt)) // 4 + pde_count * OUTPUT_TOKENS_PER_PDE
+
+
+def convert_pde_to_json_file(
+    client: OpenAI,
+    pde_name: str,
+    pde_description: str,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> Tuple[str, Optional[str], Optional[Exception]]:
     """
     Use GPT‑5.1 to convert a PDE description into a JSON object following EXAMPLE_SCHEMA,
     then save it under OUTPUT_DIR with filename `<pde_name>.json`.
+
+    Returns `(pde_name, output_path, error)`; on failure `output_path` is None and
+    `error` holds the exception, so that one bad PDE does not abort a parallel run.
     """
-    system_prompt = (
-        "You are an expert in partial differential equations and symbolic expression trees. "
-        "Convert PDE descriptions into a structured JSON object following the example "
-        "Navier–Stokes JSON schema with PDEs, initial conditions, and boundary conditions. "
-        "Use the same operator-tree style for 'lhs', 'rhs', and 'value_expr' expressions. "
-        "Respond with VALID JSON ONLY, no Markdown, no explanations."
-    )
+    output_path = _output_path(pde_name)
+    if SKIP_EXISTING and os.path.exists(output_path):
+        return pde_name, output_path, None
+    try:
+        output_path = _convert_pde(client, pde_name, pde_description, rate_limiter)
+    except Exception as e:
+        return pde_name, None, e
+    return pde_name, output_path, None
 
-    user_prompt = (
-        "Convert the given PDE into JSON format. Use the SAME structure as the example below:\n"
-        "- Top-level keys: at least 'metadata', 'variables', 'parameters', 'pdes'. You may also include 'domain', 'initial_conditions', and 'boundary_conditions'.\n"
-        "- Each PDE in 'pdes' has 'equation_id', 'type', 'lhs', 'rhs'.\n"
-        "- 'lhs' and 'rhs' are expression trees built using 'op', 'deriv', 'dep', 'param', 'const', and optionally 'fn'/'var'.\n"
-        "- Initial and boundary conditions, when present, use 'value_expr' nodes that follow the same expression-tree conventions.\n\n"
-        "IMPORTANT INSTRUCTIONS:\n"
-        " - Follow the schema closely but adapt field values to this PDE.\n"
-        " - If some information is missing, use null or a short best-guess description.\n"
-        " - Do NOT include any text outside the JSON object.\n\n"
-        "Example JSON schema:\n"
-        f"{json.dumps(EXAMPLE_SCHEMA, indent=2)}\n\n"
-        "Now convert this PDE description into JSON:\n"
-        f"{pde_description}\n"
-    )
+
+def build_user_prompt(pde_description: str) -> str:
+    """
+    User message for converting a single PDE; it follows the shared SYSTEM_MESSAGE.
+    """
+    return f"Convert this PDE into a single JSON object:\n{pde_description}\n"
+
+
+def _convert_pde(
+    client: OpenAI,
+    pde_name: str,
+    pde_description: str,
+    rate_limiter: Optional[RateLimiter],
+) -> str:
+    user_prompt = build_user_prompt(pde_description)
+    data = _request_json(client, f"PDE '{pde_name}'", user_prompt, rate_limiter)
+    return write_pde_json(pde_name, data)
+
+
+def _request_json(
+    client: OpenAI,
+    label: str,
+    user_prompt: str,
+    rate_limiter: Optional[RateLimiter],
+    pde_count: int = 1,
+) -> Any:
+    """
+    Send one chat completion with SYSTEM_PROMPT + `user_prompt` and decode the reply as JSON.
+    Replies are cached under CACHE_DIR, so an identical request is only sent once.
+    """
+    key = hashlib.blake2b(
+        (SYSTEM_PROMPT + user_prompt + MODEL).encode(), digest_size=16
+    ).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, key + ".json")
+    if os.path.exists(cache_path):
+        print(f"Using cached model output for {label} ({cache_path})")
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
 
     # Print the exact prompt sent to the model for transparency/debugging.
-    print("\n" + "=" * 80)
-    print(f"MODEL INPUT for PDE '{pde_name}':")
-    print("-" * 80)
-    print("System message:")
-    print(system_prompt)
-    print("-" * 80)
-    print("User message:")
-    print(user_prompt)
-    print("=" * 80 + "\n")
-
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        # temperature=0.1,
+    # Built as a single string so concurrent workers do not interleave lines.
+    print(
+        "\n".join(
+            [
+                "\n" + "=" * 80,
+                f"MODEL INPUT for {label}:",
+                _SYSTEM_PROMPT_LOG,
+                "User message:",
+                user_prompt,
+                "=" * 80 + "\n",
+            ]
+        )
     )
 
+    response = _create_completion(client, user_prompt, rate_limiter, pde_count)
     content = response.choices[0].message.content.strip()
 
-    # Try to be robust to occasional code fences.
-    if content.startswith("```"):
-        # Strip possible Markdown fences like ```json ... ```
-        parts = content.split("```")
-        # Take the largest non-empty chunk as the JSON candidate
-        candidates = [p.strip() for p in parts if p.strip()]
-        if candidates:
-            content = max(candidates, key=len)
-
+    # Still validated, in case the reply was truncated.
     try:
-        data = json.loads(content)
-    except json.JSONDecodeError as e:
+        data = orjson.loads(content)
+    except orjson.JSONDecodeError as e:
         raise ValueError(f"Model did not return valid JSON. Raw content:\n{content}") from e
 
-    output_path = os.path.join(OUTPUT_DIR, f"{pde_name}.json")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    # Write to a temporary file first so a concurrent reader never sees a partial entry.
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(data))
+    os.replace(tmp_path, cache_path)
+
+    return data
+
 
+def _create_completion(
+    client: OpenAI,
+    user_prompt: str,
+    rate_limiter: Optional[RateLimiter],
+    pde_count: int = 1,
+) -> Any:
+    """
+    Call the chat completions endpoint, retrying rate-limit, connection, timeout and
+    server errors up to MAX_RETRIES times with exponential backoff and full jitter.
+    """
+    tokens = estimate_tokens(user_prompt, pde_count)
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait(tokens)
+        try:
+            return client.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    SYSTEM_MESSAGE,
+                    {"role": "user", "content": user_prompt},
+                ],
+                # JSON mode: the server guarantees a single JSON object, so no Markdown fences.
+                response_format={"type": "json_object"},
+                # temperature=0.1,
+            )
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+            time.sleep(random.uniform(0, delay))
+
+
+def _output_path(pde_name: str) -> str:
+    return os.path.join(OUTPUT_DIR, f"{pde_name}.json")
+
+
+def write_pde_json(pde_name: str, data: Any) -> str:
+    """
+    Save one converted PDE under OUTPUT_DIR as `<pde_name>.json` and return the path.
+    """
+    output_path = _output_path(pde_name)
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     return output_path
 
 
+def convert_pdes_to_json_files(
+    client: OpenAI,
+    items: Sequence[Tuple[str, str]],
+    batch_size: int = 8,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> List[Tuple[str, Optional[str], Optional[Exception]]]:
+    """
+    Convert several `(pde_name, pde_description)` pairs, packing up to `batch_size`
+    PDEs into each chat completion so the schema and instructions are sent once per
+    batch instead of once per PDE.
+
+    If the model's reply for a batch does not hold a 'results' array of the expected
+    length, the batch is retried in halves, down to single-PDE requests via
+    convert_pde_to_json_file.
+    Returns one `(pde_name, output_path, error)` tuple per item, in input order, except
+    that PDEs skipped because of PDE_SKIP_EXISTING are reported first.
+    """
+    results: List[Tuple[str, Optional[str], Optional[Exception]]] = []
+    if SKIP_EXISTING:
+        pending = []
+        for name, desc in items:
+            output_path = _output_path(name)
+            if os.path.exists(output_path):
+                results.append((name, output_path, None))
+            else:
+                pending.append((name, desc))
+        items = pending
+
+    for start in range(0, len(items), max(batch_size, 1)):
+        chunk = items[start : start + max(batch_size, 1)]
+        if len(chunk) == 1:
+            name, desc = chunk[0]
+            results.append(convert_pde_to_json_file(client, name, desc, rate_limiter))
+            continue
+
+        try:
+            data_list = _request_batch(client, chunk, rate_limiter)
+        except ValueError:
+            # Malformed or mis-sized reply: split the batch and try again.
+            results.extend(
+                convert_pdes_to_json_files(client, chunk, batch_size // 2, rate_limiter)
+            )
+            continue
+        except Exception as e:
+            results.extend((name, None, e) for name, _ in chunk)
+            continue
+
+        for (name, _), data in zip(chunk, data_list):
+            try:
+                results.append((name, write_pde_json(name, data), None))
+            except Exception as e:
+                results.append((name, None, e))
+
+    return results
+
+
+def _request_batch(
+    client: OpenAI,
+    chunk: Sequence[Tuple[str, str]],
+    rate_limiter: Optional[RateLimiter],
+) -> List[Any]:
+    numbered = "\n\n".join(
+        f"PDE {i}:\n{desc}" for i, (_, desc) in enumerate(chunk, start=1)
+    )
+    user_prompt = (
+        f"Convert each of these {len(chunk)} PDEs. Return a JSON object with a single key "
+        f"'results' holding an array of length {len(chunk)} where element i (0-based) is "
+        "the JSON object for PDE i+1.\n\n"
+        f"{numbered}\n"
+    )
+
+    names = ", ".join(repr(name) for name, _ in chunk)
+    data = _request_json(client, f"PDE batch [{names}]", user_prompt, rate_limiter, len(chunk))
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list) or len(results) != len(chunk):
+        raise ValueError(
+            f"Expected 'results' to be an array of {len(chunk)} PDE objects, got: "
+            f"{type(results).__name__}"
+            + (f" of length {len(results)}" if isinstance(results, list) else "")
+        )
+    return results
+
+
 def main() -> None:
     """
     Simple example: generate JSON representations for a few PDEs.
@@ -334,8 +600,11 @@ def main() -> None:
         ),
     }
 
+    client = create_client()
     for name, desc in pdes.items():
-        path = convert_pde_to_json_file(name, desc)
+        _, path, error = convert_pde_to_json_file(client, name, desc)
+        if error is not None:
+            raise error
         print(f"Saved JSON for '{name}' to: {path}")
 
 
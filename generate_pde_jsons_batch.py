@@ -0,0 +1,129 @@
+import os
+import time
+from typing import List
+
+import orjson
+
+from generate_from_example_pdes import build_description, load_examples, unique_examples
+from generate_pde_jsons import MODEL, SYSTEM_MESSAGE, build_user_prompt, create_client, write_pde_json
+
+
+# Request file uploaded to the Batch API (one chat completion per line).
+BATCH_INPUT_PATH = "pde_batch_input.jsonl"
+# Seconds between status checks while the batch is running.
+POLL_INTERVAL = float(os.getenv("PDE_BATCH_POLL_INTERVAL", "60"))
+# Set PDE_BATCH_ID to resume waiting on a batch submitted by an earlier run.
+RESUME_BATCH_ID = os.getenv("PDE_BATCH_ID")
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_batch_input(path: str = BATCH_INPUT_PATH) -> int:
+    """
+    Write one Batch API request line per entry of EXAMPLE_PDES_PATH, using the same
+    messages as the synchronous path, and return the number of requests.
+    """
+    # custom_id must be unique within a batch, which unique_examples guarantees.
+    examples = unique_examples(load_examples())
+
+    lines: List[bytes] = []
+    for entry in examples:
+        request = {
+            "custom_id": entry.get("name", "unnamed_pde"),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODEL,
+                "messages": [
+                    SYSTEM_MESSAGE,
+                    {"role": "user", "content": build_user_prompt(build_description(entry))},
+                ],
+                "response_format": {"type": "json_object"},
+            },
+        }
+        lines.append(orjson.dumps(request))
+
+    with open(path, "wb") as f:
+        f.write(b"\n".join(lines) + b"\n")
+
+    return len(lines)
+
+
+def main() -> None:
+    """
+    Generate all PDE JSONs through the OpenAI Batch API: half the token price of the
+    synchronous path, at the cost of a completion window of up to 24h.
+    """
+    # Let the SDK retry uploads and status polls; the batch may run for hours.
+    client = create_client(max_retries=2)
+
+    if RESUME_BATCH_ID:
+        batch = client.batches.retrieve(RESUME_BATCH_ID)
+        print(f"Resuming batch {batch.id} (status: {batch.status})")
+    else:
+        count = write_batch_input()
+        with open(BATCH_INPUT_PATH, "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"Submitted batch {batch.id} with {count} request(s)")
+        print(f"  (set PDE_BATCH_ID={batch.id} to resume waiting on it later)")
+
+    while batch.status not in TERMINAL_STATUSES:
+        time.sleep(POLL_INTERVAL)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(
+                f"Batch {batch.id}: {batch.status} "
+                f"({counts.completed}/{counts.total} done, {counts.failed} failed)"
+            )
+        else:
+            print(f"Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status!r}")
+
+    failures: List[str] = []
+    # A completed batch has no output file when every request failed; those are
+    # all listed in the error file below.
+    output = client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        name = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            failures.append(name)
+            print(f"  Failed {name!r}: {record.get('error') or response.get('body')}")
+            continue
+
+        # content is null when the model refuses; catch both errors orjson may raise for it.
+        content = response["body"]["choices"][0]["message"]["content"]
+        try:
+            data = orjson.loads(content)
+        except (TypeError, orjson.JSONDecodeError):
+            failures.append(name)
+            print(f"  Failed {name!r}: model did not return valid JSON")
+            continue
+        print(f"  Saved {name!r} to {write_pde_json(name, data)}")
+
+    if batch.error_file_id:
+        # Requests that were rejected outright are reported in a separate file.
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if line.strip():
+                record = orjson.loads(line)
+                name = record["custom_id"]
+                failures.append(name)
+                print(f"  Failed {name!r}: {record.get('error') or record.get('response')}")
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} PDE(s) failed: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
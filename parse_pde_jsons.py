@@ -1,16 +1,46 @@
-import json
+import io
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
+import ijson
+
 
 INPUT_DIR = "example_pde_jsons"
 
+# Top-level keys that format_pde_file actually prints; any other top-level value
+# is dropped as soon as ijson yields it.
+_USED_KEYS = {
+    "metadata",
+    "variables",
+    "parameters",
+    "domain",
+    "pdes",
+    "initial_conditions",
+    "boundary_conditions",
+}
+
 
 def expr_to_str(node: Dict[str, Any]) -> str:
     """
     Convert an expression-tree node (op/deriv/dep/param/const/fn/var) into a readable string.
     This is a simple pretty-printer; you can refine formatting later.
+
+    Rendering is recursive, which is fastest for the shallow trees seen in practice
+    (the trees in this repo are at most ~10 levels deep). Trees nested close to the
+    interpreter recursion limit (~1000 levels by default) raise ValueError.
     """
+    try:
+        return _expr_to_str(node)
+    except RecursionError:
+        raise ValueError(
+            "Expression tree is nested too deeply to render "
+            f"(recursion limit {sys.getrecursionlimit()})."
+        ) from None
+
+
+def _expr_to_str(node: Dict[str, Any]) -> str:
     node_type = node.get("type")
 
     if node_type == "deriv":
@@ -36,7 +66,7 @@ def expr_to_str(node: Dict[str, Any]) -> str:
 
     if node_type == "fn":
         name = node["name"]
-        args = ", ".join(expr_to_str(a) for a in node.get("args", []))
+        args = ", ".join([_expr_to_str(a) for a in node.get("args", [])])
         return f"{name}({args})"
 
     if node_type == "op":
@@ -44,15 +74,15 @@ def expr_to_str(node: Dict[str, Any]) -> str:
         args: List[Dict[str, Any]] = node.get("args", [])
         # Binary infix operators
         if op in {"+", "-", "*", "/", "^"} and len(args) == 2:
-            left = expr_to_str(args[0])
-            right = expr_to_str(args[1])
+            left = _expr_to_str(args[0])
+            right = _expr_to_str(args[1])
             if op == "*":
                 return f"({left} {right})"
             if op == "^":
                 return f"({left}^{right})"
             return f"({left} {op} {right})"
         # Generic op: join arguments
-        inner = ", ".join(expr_to_str(a) for a in args)
+        inner = ", ".join([_expr_to_str(a) for a in args])
         return f"{op}({inner})"
 
     return "<?>"
@@ -75,17 +105,47 @@ def classify_equation(eq_id: str) -> str:
     return "pde"
 
 
+def _load_used_keys(path: str) -> Dict[str, Any]:
+    """
+    Stream a PDE JSON file's top-level object with ijson.kvitems, keeping only the
+    keys listed in _USED_KEYS. Raises ValueError if the document is not an object.
+    """
+    with open(path, "rb") as f:
+        # kvitems yields nothing for a non-object document, so check the first
+        # significant byte up front instead of silently printing an empty block.
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first != b"{":
+            raise ValueError(f"{path}: top-level JSON value is not an object")
+        f.seek(0)
+        return {
+            key: value
+            for key, value in ijson.kvitems(f, "", use_float=True)
+            if key in _USED_KEYS
+        }
+
+
 def print_pde_file(path: str) -> None:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    sys.stdout.write(format_pde_file(path))
+
+
+def format_pde_file(path: str) -> str:
+    """
+    Render one PDE JSON file as the readable text block printed by main().
+    Lines are accumulated in an in-memory buffer rather than printed one by one.
+    """
+    buf = io.StringIO()
+
+    data = _load_used_keys(path)
 
     metadata = data.get("metadata", {})
     name = metadata.get("name", os.path.basename(path))
     description = metadata.get("description")
     
-    print(f"\n=== {name} ===")
+    buf.write(f"\n=== {name} ===\n")
     if description:
-        print(f"Description: {description}")
+        buf.write(f"Description: {description}\n")
 
     # Print variables
     variables = data.get("variables", {})
@@ -93,9 +153,9 @@ def print_pde_file(path: str) -> None:
         indep = variables.get("independent", [])
         dep = variables.get("dependent", [])
         if indep:
-            print(f"Independent variables: {', '.join(indep)}")
+            buf.write(f"Independent variables: {', '.join(indep)}\n")
         if dep:
-            print(f"Dependent variables: {', '.join(dep)}")
+            buf.write(f"Dependent variables: {', '.join(dep)}\n")
 
     # Print parameters with their values
     parameters = data.get("parameters", {})
@@ -107,19 +167,19 @@ def print_pde_file(path: str) -> None:
             else:
                 param_strs.append(f"{param_name} = {param_value}")
         if param_strs:
-            print(f"Parameters: {', '.join(param_strs)}")
+            buf.write(f"Parameters: {', '.join(param_strs)}\n")
 
     # Optional: print domain information if present.
     domain = data.get("domain")
     if domain:
-        print("Domain:")
+        buf.write("Domain:\n")
         for var, interval in domain.items():
             if isinstance(interval, list) and len(interval) == 2:
                 a, b = interval
                 a_str = expr_to_str(a) if isinstance(a, dict) else str(a)
                 b_str = expr_to_str(b) if isinstance(b, dict) else str(b)
-                print(f"  {var} ∈ [{a_str}, {b_str}]")
-        print()
+                buf.write(f"  {var} ∈ [{a_str}, {b_str}]\n")
+        buf.write("\n")
 
     pdes = data.get("pdes", [])
     main_pdes = []
@@ -140,24 +200,24 @@ def print_pde_file(path: str) -> None:
         else:
             initials.append((eq_id, eq_str))
 
-    print("\nPDE(s):")
+    buf.write("\nPDE(s):\n")
     for eq_id, eq_str in main_pdes:
-        print(f"  [{eq_id}]  {eq_str}")
+        buf.write(f"  [{eq_id}]  {eq_str}\n")
 
-    print("\nBoundary condition(s) (from 'pdes'):")
+    buf.write("\nBoundary condition(s) (from 'pdes'):\n")
     for eq_id, eq_str in boundaries:
-        print(f"  [{eq_id}]  {eq_str}")
+        buf.write(f"  [{eq_id}]  {eq_str}\n")
 
-    print("\nInitial condition(s) (from 'pdes'):")
+    buf.write("\nInitial condition(s) (from 'pdes'):\n")
     for eq_id, eq_str in initials:
-        print(f"  [{eq_id}]  {eq_str}")
+        buf.write(f"  [{eq_id}]  {eq_str}\n")
 
     # Also handle top-level initial_conditions / boundary_conditions, if present.
     top_ics = data.get("initial_conditions", [])
     top_bcs = data.get("boundary_conditions", [])
 
     if top_ics:
-        print("\nInitial condition(s) (from 'initial_conditions'):")
+        buf.write("\nInitial condition(s) (from 'initial_conditions'):\n")
         for ic in top_ics:
             dep = ic.get("dep", "?")
             ic_type = ic.get("type", "ic")
@@ -175,10 +235,10 @@ def print_pde_file(path: str) -> None:
             ic_line = f"  [{ic_type}] {dep} at {loc_str}: {val_expr}"
             if notes:
                 ic_line += f" ({notes})"
-            print(ic_line)
+            buf.write(f"{ic_line}\n")
 
     if top_bcs:
-        print("\nBoundary condition(s) (from 'boundary_conditions'):")
+        buf.write("\nBoundary condition(s) (from 'boundary_conditions'):\n")
         for bc in top_bcs:
             dep = bc.get("dep", "?")
             bc_type = bc.get("type", "?")
@@ -198,7 +258,9 @@ def print_pde_file(path: str) -> None:
             bc_line = f"  [{bc_type}] {dep} at {spec_str}: {val_expr}"
             if notes:
                 bc_line += f" ({notes})"
-            print(bc_line)
+            buf.write(f"{bc_line}\n")
+
+    return buf.getvalue()
 
 
 def main() -> None:
@@ -209,14 +271,22 @@ def main() -> None:
     if not os.path.isdir(INPUT_DIR):
         raise RuntimeError(f"Directory '{INPUT_DIR}' does not exist.")
 
-    files = [f for f in os.listdir(INPUT_DIR) if f.endswith(".json")]
-    if not files:
+    entries = sorted(e.path for e in os.scandir(INPUT_DIR) if e.name.endswith(".json"))
+    if not entries:
         print(f"No JSON files found in '{INPUT_DIR}'.")
         return
 
-    for filename in sorted(files):
-        full_path = os.path.join(INPUT_DIR, filename)
-        print_pde_file(full_path)
+    # Read and format files in parallel; map() yields results in input order,
+    # so the printed output is the same as a sequential pass. Everything is
+    # written to stdout in a single call at the end (including the files
+    # formatted before an error, if one occurs).
+    outputs: List[str] = []
+    try:
+        with ThreadPoolExecutor() as executor:
+            outputs.extend(executor.map(format_pde_file, entries))
+    finally:
+        sys.stdout.write("".join(outputs))
+        sys.stdout.flush()
 
 
 if __name__ == "__main__":